@@ -2,24 +2,29 @@ import argparse
 import os
 import json
 import io
+import orjson
 import requests
 from PIL import Image
 from typing import Dict, Any
+from urllib.parse import urljoin
 from huffman import HuffmanCodec
 from linear import LinearCodec
 from utils import (
+    BitVec,
     is_image_file, read_file_bytes,
-    calculate_sha256, calculate_entropy,
-    bit_string_to_bytes,
-    pkcs7_pad_bit_string,
+    hash_and_entropy_bytes,
+    pkcs7_pad_bitvec,
     inject_bit_errors,
     to_base64,from_base64
 )
 
 N_HAMMING = 128
 K_HAMMING = 120
+# Above this many bits/byte Huffman can save at most about 6% of the size, which is not worth
+# the encode/decode CPU time and the frequency map sent along with the payload.
+HUFFMAN_ENTROPY_THRESHOLD = 7.5
 
-def process_and_send(filepath: str, error_rate: float, server_url: str):
+def process_and_send(filepath: str, error_rate: float, server_url: str, stream: bool = False):
     print(f"--- Client: Processing file '{filepath}' ---")
 
     if not os.path.isfile(filepath):
@@ -36,76 +41,93 @@ def process_and_send(filepath: str, error_rate: float, server_url: str):
 
     print(f"Original image size: {len(original_image_data)} bytes")
 
-    # Calculate hash
-    sha256 = calculate_sha256(original_image_data)
+    # Calculate hash and entropy in a single pass over the bytes that are encoded below
+    sha256, entropy = hash_and_entropy_bytes(original_image_data)
     print(f"Original SHA256: {sha256}")
-
-    #Calculate entropy
-    entropy = calculate_entropy(original_image_data)
     print(f"Original Entropy: {entropy}")
 
-    # Compress with huffman
-    huffman_coder = HuffmanCodec()
-    huffman_compressed_bits, huffman_freq_map = huffman_coder.compress_to_bit_string(original_image_data)
-    if not huffman_compressed_bits and original_image_data:
-        print("Error: Huffman compression resulted in empty bit string for non-empty data.")
-        return
-    original_huffman_bit_length = len(huffman_compressed_bits)
-    print(f"Huffman compressed to {original_huffman_bit_length} bits.")
+    # Compress with huffman, unless the data is already incompressible
+    if entropy > HUFFMAN_ENTROPY_THRESHOLD:
+        compression_algorithm = "none"
+        huffman_compressed_bits, huffman_freq_map = BitVec.from_bytes(original_image_data), {}
+        print(f"Entropy above {HUFFMAN_ENTROPY_THRESHOLD} bits/byte, skipping Huffman compression.")
+    else:
+        compression_algorithm = "huffman"
+        huffman_coder = HuffmanCodec()
+        huffman_compressed_bits, huffman_freq_map = huffman_coder.compress(original_image_data)
+        if not huffman_compressed_bits.nbits and original_image_data:
+            print("Error: Huffman compression resulted in empty bit string for non-empty data.")
+            return
+        print(f"Huffman compressed to {huffman_compressed_bits.nbits} bits.")
+    original_huffman_bit_length = huffman_compressed_bits.nbits
 
     # Apply padding
-    padded_bits = pkcs7_pad_bit_string(huffman_compressed_bits, block_size_bits=K_HAMMING)
-    if len(padded_bits) % K_HAMMING != 0:
-        print(f"Error: PKCS#7 padding failed. Length {len(padded_bits)} is not multiple of {K_HAMMING}.")
+    padded_bits = pkcs7_pad_bitvec(huffman_compressed_bits, block_size_bits=K_HAMMING)
+    if padded_bits.nbits % K_HAMMING != 0:
+        print(f"Error: PKCS#7 padding failed. Length {padded_bits.nbits} is not multiple of {K_HAMMING}.")
         return
 
     # Linear encoding
     linear_coder = LinearCodec(n=N_HAMMING, k=K_HAMMING)
-    encoded_chunks = []
-    for i in range(0, len(padded_bits), K_HAMMING):
-        chunk_k_bits = padded_bits[i: i + K_HAMMING]
-        encoded_chunk_n_bits = linear_coder.encode(chunk_k_bits)
-        encoded_chunks.append(encoded_chunk_n_bits)
-    linearly_encoded_bits = "".join(encoded_chunks)
-    print(f"Linearly encoded to {len(linearly_encoded_bits)} bits (output blocks of {N_HAMMING}).")
+    linearly_encoded_bits = linear_coder.encode_bitvec(padded_bits)
+    print(f"Linearly encoded to {linearly_encoded_bits.nbits} bits (output blocks of {N_HAMMING}).")
 
     # Inject errors
     errored_bits, num_errors_injected = inject_bit_errors(linearly_encoded_bits, error_rate)
     print(f"Injected {num_errors_injected} errors.")
 
-    # Base64 encode
-    encoded_bytes = bit_string_to_bytes(errored_bits)
-    b64_encoded_message = to_base64(encoded_bytes)
+    encoded_bytes = errored_bits.to_bytes()
 
     payload_parameters: Dict[str, Any] = {
         "huffman_freq_map": huffman_freq_map,
         "original_huffman_bit_length": original_huffman_bit_length,
-        "padded_length": len(padded_bits),
+        "padded_length": padded_bits.nbits,
         "linear_codec_params": linear_coder.get_parameters()
     }
 
-    # Build payload
-    payload = {
-        "encoded_message": b64_encoded_message,
-        "compression_algorithm": "huffman",
-        "encoding": "linear",
-        "parameters": payload_parameters,
-        "errors": num_errors_injected,
-        "SHA256": sha256,
-        "entropy": entropy
-    }
-
-    print(f"\n--- Sending JSON payload to {server_url} ---")
-    #print(payload)
+    if stream:
+        # The stream endpoint takes the raw encoded bytes as the body and the rest in headers
+        request_url = urljoin(server_url, "stream")
+        request_body = encoded_bytes
+        request_headers = {
+            "Content-Type": "application/octet-stream",
+            "X-Parameters": orjson.dumps(payload_parameters, option=orjson.OPT_NON_STR_KEYS).decode('ascii'),
+            "X-Compression-Algorithm": compression_algorithm,
+            "X-Errors": str(num_errors_injected),
+            "X-SHA256": sha256
+        }
+        print(f"\n--- Streaming encoded message to {request_url} ---")
+    else:
+        # Build payload
+        payload = {
+            "encoded_message": to_base64(encoded_bytes),
+            "compression_algorithm": compression_algorithm,
+            "encoding": "linear",
+            "parameters": payload_parameters,
+            "errors": num_errors_injected,
+            "SHA256": sha256,
+            "entropy": entropy
+        }
+        request_url = server_url
+        request_body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        request_headers = {"Content-Type": "application/json"}
+        print(f"\n--- Sending JSON payload to {request_url} ---")
+        #print(payload)
 
     try:
-        response = requests.post(server_url, json=payload, timeout=30)
+        response = requests.post(request_url,
+                                 data=request_body,
+                                 headers=request_headers,
+                                 timeout=30)
         response.raise_for_status()
         print("\n--- Server Response ---")
-        response_data = response.json()
-        
-        display_data = dict(response_data)
-        display_data["decoded_image"] = display_data["decoded_image"][:60] + "..." + display_data["decoded_image"][-60:]
+        response_data = orjson.loads(response.content)
+
+        # Copy only the small fields; the Base64 image is shown as a short excerpt.
+        display_data = {key: value for key, value in response_data.items() if key != "decoded_image"}
+        decoded_image_b64 = response_data.get("decoded_image")
+        if isinstance(decoded_image_b64, str):
+            display_data["decoded_image"] = decoded_image_b64[:60] + "..." + decoded_image_b64[-60:]
         
         # Display response
         print(json.dumps(display_data, indent=2))
@@ -155,10 +177,12 @@ if __name__ == "__main__":
                         help="Percentage of random bit errors to introduce (e.g., 1.5 for 1.5%%).")
     parser.add_argument("--url", default="http://127.0.0.1:5000/",
                         help="URL of the server endpoint.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Send the encoded message as a raw byte stream to the server's /stream endpoint.")
 
     args = parser.parse_args()
 
     if args.errors < 0 or args.errors > 100:
         print("Error: Error percentage must be between 0 and 100.")
     else:
-        process_and_send(args.filepath, args.errors, args.url)
\ No newline at end of file
+        process_and_send(args.filepath, args.errors, args.url, args.stream)
\ No newline at end of file
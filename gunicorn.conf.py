@@ -0,0 +1,11 @@
+import ssl
+
+bind = "127.0.0.1:5000"
+worker_class = "gthread"
+workers = 4
+threads = 8
+keepalive = 5
+timeout = 120
+
+def when_ready(server):
+    server.log.info("SHA256 backend: %s", ssl.OPENSSL_VERSION)
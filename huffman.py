@@ -1,6 +1,12 @@
 import heapq
-import collections
-from typing import Dict, Optional, Tuple
+import functools
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Union
+from utils import BitVec
+from huffman_numba import NUMBA_AVAILABLE
+
+if NUMBA_AVAILABLE:
+    from huffman_numba import encode_bits, decode_bits
 
 class HuffmanNode:
     __slots__ = ('symbol', 'frequency', 'left', 'right')
@@ -17,32 +23,184 @@ class HuffmanNode:
     def __repr__(self) -> str:
         return f"HuffmanNode(symbol={self.symbol}, frequency={self.frequency})"
 
+class HuffmanDecoder:
+    # Decode-only view of a built code: the flattened tree, plus the byte-at-a-time table that
+    # is built on first use when Numba is unavailable. Nothing in it changes after that.
+    def __init__(self, tree_left: np.ndarray, tree_right: np.ndarray):
+        self._tree_left = tree_left
+        self._tree_right = tree_right
+        self._decode_table: Optional[List[List[Optional[Tuple[bytes, int]]]]] = None
+
+    def decode(self, bits: BitVec) -> bytes:
+        if not bits.nbits or not len(self._tree_left):
+            return b""
+
+        nbits = bits.nbits
+        packed = bits.buf
+        if NUMBA_AVAILABLE:
+            out = np.empty(nbits, dtype=np.uint8)
+            count = decode_bits(packed, nbits, self._tree_left, self._tree_right, out)
+            if count < 0:
+                raise ValueError("Bit string contains a code that is not in the Huffman tree")
+            return out[:count].tobytes()
+
+        if self._decode_table is None:
+            self._decode_table = self._build_decode_table()
+
+        decoded_chunks = []
+        state = 0
+        full_bytes = nbits // 8
+        for byte in packed[:full_bytes].tobytes():
+            entry = self._decode_table[state][byte]
+            if entry is None:
+                raise ValueError("Bit string contains a code that is not in the Huffman tree")
+            symbols, state = entry
+            decoded_chunks.append(symbols)
+
+        tail_symbols = []
+        for bit in np.unpackbits(packed[full_bytes:], count=nbits - full_bytes * 8).tolist():
+            state = int(self._tree_right[state] if bit else self._tree_left[state])
+            if state == 0:
+                raise ValueError("Bit string contains a code that is not in the Huffman tree")
+            if state < 0:
+                tail_symbols.append(-(state + 1))
+                state = 0
+        decoded_chunks.append(bytes(tail_symbols))
+        return b"".join(decoded_chunks)
+
+    def _build_decode_table(self) -> List[List[Optional[Tuple[bytes, int]]]]:
+        # Entry [state][byte] gives the symbols completed while reading those 8 bits from
+        # internal node `state`, and the internal node the walk ends on (None if the walk
+        # hits a missing branch). All states and byte values are walked together.
+        num_states = len(self._tree_left)
+        byte_values = np.arange(256)
+        node = np.repeat(np.arange(num_states, dtype=np.int32)[:, None], 256, axis=1)
+        emitted = np.zeros((num_states, 256, 8), dtype=np.uint8)
+        counts = np.zeros((num_states, 256), dtype=np.intp)
+        valid = np.ones((num_states, 256), dtype=bool)
+        for k in range(8):
+            bit_set = ((byte_values >> (7 - k)) & 1).astype(bool)
+            node = np.where(bit_set, self._tree_right[node], self._tree_left[node])
+            valid &= node != 0
+            leaf = node < 0
+            states, values = np.nonzero(leaf)
+            emitted[states, values, counts[states, values]] = -(node[leaf] + 1)
+            counts[leaf] += 1
+            node[leaf] = 0
+
+        emitted_rows = emitted.tolist()
+        counts_rows = counts.tolist()
+        node_rows = node.tolist()
+        valid_rows = valid.tolist()
+        return [
+            [(bytes(emitted_rows[s][b][:counts_rows[s][b]]), node_rows[s][b]) if valid_rows[s][b] else None
+             for b in range(256)]
+            for s in range(num_states)
+        ]
+
+
 class HuffmanCodec:
     def __init__(self, data: Optional[bytes] = None):
         self.data: bytes = data or b""
         self.frequency_map: Dict[int, int] = {}
         self.root: Optional[HuffmanNode] = None
         self.code_map: Dict[int, str] = {}
+        self._lut_val: np.ndarray = np.zeros(256, dtype=np.uint64)
+        self._lut_len: np.ndarray = np.zeros(256, dtype=np.uint8)
+        self._lut_bits: np.ndarray = np.zeros((256, 0), dtype=np.uint8)
+        self._tree_left: np.ndarray = np.zeros(0, dtype=np.int32)
+        self._tree_right: np.ndarray = np.zeros(0, dtype=np.int32)
+        self._decoder = HuffmanDecoder(self._tree_left, self._tree_right)
         
+    @classmethod
+    def decoder_for_frequency_map(cls, frequency_map: Dict[int, int]) -> HuffmanDecoder:
+        return cls._decoder_from_frequencies(tuple(sorted(frequency_map.items())))
+
+    # One decoder per frequency map is shared between requests. Kept small because without
+    # Numba each decoder holds a byte-at-a-time table of several MB.
+    @classmethod
+    @functools.lru_cache(maxsize=8)
+    def _decoder_from_frequencies(cls, frequencies: Tuple[Tuple[int, int], ...]) -> HuffmanDecoder:
+        codec = cls()
+        codec.frequency_map = dict(frequencies)
+        if codec.frequency_map:
+            codec._build_codes()
+        return codec._decoder
+
     def build(self) -> None:
-        self.frequency_map = dict(collections.Counter(self.data))
-        self.root = self._build_tree(self.frequency_map)
-        self.code_map = self._generate_codes(self.root)
+        self._build_from_counts(self._count_symbols(self.data))
+
+    @staticmethod
+    def _count_symbols(data: bytes) -> np.ndarray:
+        return np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+
+    def _build_from_counts(self, symbol_counts: np.ndarray) -> None:
+        self.frequency_map = {int(symbol): int(symbol_counts[symbol]) for symbol in np.flatnonzero(symbol_counts)}
+        self._build_codes()
+
+    def _build_codes(self) -> None:
+        code_lengths = self._generate_code_lengths(self._build_tree(self.frequency_map))
+        self._assign_canonical_codes(code_lengths)
+        self.root = self._build_decode_tree()
+        self._flatten_tree()
+        self._decoder = HuffmanDecoder(self._tree_left, self._tree_right)
+        self._build_lut()
+
+    def _build_lut(self) -> None:
+        # Row s holds the code bits of symbol s, left aligned and zero filled to the longest code.
+        max_len = int(self._lut_len.max())
+        shifts = self._lut_len.astype(np.int64)[:, None] - 1 - np.arange(max_len)
+        self._lut_bits = ((self._lut_val[:, None] >> np.maximum(shifts, 0).astype(np.uint64)) & 1).astype(np.uint8)
+        self._lut_bits[shifts < 0] = 0
 
-    def compress(self, data: Optional[bytes] = None) -> Tuple[str, Dict[int, int]]:
+    def _encode_packed(self, data: bytes, symbol_counts: np.ndarray, chunk_size: int = 1 << 16) -> BitVec:
+        symbols = np.frombuffer(data, dtype=np.uint8)
+        if (self._lut_len[symbol_counts > 0] == 0).any():
+            raise KeyError("Data contains symbols that have no Huffman code")
+        nbits = int((symbol_counts * self._lut_len).sum())
+
+        if NUMBA_AVAILABLE and self._lut_len.max() <= 56:
+            out = np.empty((nbits + 7) // 8, dtype=np.uint8)
+            encode_bits(symbols, self._lut_val.astype(np.int64), self._lut_len.astype(np.int64), out)
+            return BitVec(out, nbits)
+
+        positions = np.arange(self._lut_bits.shape[1])
+        packed_chunks = []
+        carry = np.zeros(0, dtype=np.uint8)
+        for start in range(0, len(symbols), chunk_size):
+            chunk = symbols[start:start + chunk_size]
+            mask = positions < self._lut_len[chunk][:, None]
+            bits = np.concatenate((carry, self._lut_bits[chunk][mask]))
+            aligned = len(bits) - len(bits) % 8
+            packed_chunks.append(np.packbits(bits[:aligned]))
+            carry = bits[aligned:]
+        packed_chunks.append(np.packbits(carry))
+
+        return BitVec(np.concatenate(packed_chunks), nbits)
+
+    def compress(self, data: Optional[bytes] = None) -> Tuple[BitVec, Dict[int, int]]:
         input_data = data if data is not None else self.data
         if not input_data:
-            return "", {}
+            return BitVec(np.zeros(0, dtype=np.uint8), 0), {}
 
         self.data = input_data
+        # One histogram serves both the frequency map and the encoded length.
+        symbol_counts = self._count_symbols(self.data)
         if not self.code_map:
-            self.build()
+            self._build_from_counts(symbol_counts)
+
+        return self._encode_packed(self.data, symbol_counts), self.frequency_map
 
-        bit_string = ''.join(self.code_map[b] for b in self.data)
-        return bit_string, self.frequency_map
+    def decompress(self, bits: Union[BitVec, str], frequency_map: Optional[Dict[int, int]] = None) -> bytes:
+        # Accepts the BitVec returned by compress() as well as a '0'/'1' string.
+        if isinstance(bits, str):
+            if not bits:
+                return b""
+            bits = BitVec.from_bit_string(bits)
+        return self.decompress_bits(bits, frequency_map)
 
-    def decompress(self, bit_string: str, frequency_map: Optional[Dict[int, int]] = None) -> bytes:
-        if not bit_string:
+    def decompress_bits(self, bits: BitVec, frequency_map: Optional[Dict[int, int]] = None) -> bytes:
+        if not bits.nbits:
             return b""
             
         if frequency_map is not None:
@@ -51,22 +209,16 @@ class HuffmanCodec:
             return b""
 
         if self.root is None or frequency_map is not None:
-            self.root = self._build_tree(self.frequency_map)
+            self._build_codes()
 
-        decoded_bytes = []
-        node = self.root
-        for bit in bit_string:
-            node = node.left if bit == '0' else node.right
-            if node.symbol is not None:
-                decoded_bytes.append(node.symbol)
-                node = self.root
-        return bytes(decoded_bytes)
+        return self._decoder.decode(bits)
 
     def _build_tree(self, freq_map: Dict[int, int]) -> Optional[HuffmanNode]:
         if not freq_map:
             return None
 
-        queue = [HuffmanNode(s, f) for s, f in freq_map.items()]
+        # Sorting makes tie-breaking, and so the code lengths, independent of the map's key order.
+        queue = [HuffmanNode(s, f) for s, f in sorted(freq_map.items())]
         heapq.heapify(queue)
 
         if len(queue) == 1:
@@ -85,23 +237,93 @@ class HuffmanCodec:
 
         return queue[0]
 
-    def _generate_codes(self, node: Optional[HuffmanNode], prefix: str = "", code_map: Optional[Dict[int, str]] = None) -> Dict[int, str]:
-        code_map = code_map if code_map is not None else {}
-        if node is None:
-            return code_map
-
-        if node.symbol is not None:
-            code_map[node.symbol] = prefix or "0"
-        else:
+    def _generate_code_lengths(self, root: Optional[HuffmanNode]) -> Dict[int, int]:
+        code_lengths: Dict[int, int] = {}
+        stack = [(root, 0)] if root is not None else []
+        while stack:
+            node, depth = stack.pop()
+            if node.symbol is not None:
+                code_lengths[node.symbol] = max(depth, 1)
+                continue
             if node.left:
-                self._generate_codes(node.left, prefix + "0", code_map)
+                stack.append((node.left, depth + 1))
             if node.right:
-                self._generate_codes(node.right, prefix + "1", code_map)
+                stack.append((node.right, depth + 1))
+
+        return code_lengths
+
+    def _assign_canonical_codes(self, code_lengths: Dict[int, int]) -> None:
+        self._lut_val = np.zeros(256, dtype=np.uint64)
+        self._lut_len = np.zeros(256, dtype=np.uint8)
+        self.code_map = {}
+
+        code = 0
+        previous_length = 0
+        for symbol, length in sorted(code_lengths.items(), key=lambda item: (item[1], item[0])):
+            code <<= length - previous_length
+            self._lut_val[symbol] = code
+            self._lut_len[symbol] = length
+            self.code_map[symbol] = format(code, f'0{length}b')
+            code += 1
+            previous_length = length
+
+    def _build_decode_tree(self) -> Optional[HuffmanNode]:
+        if not self.code_map:
+            return None
 
-        return code_map
+        root = HuffmanNode(None, sum(self.frequency_map.values()))
+        for symbol, code in self.code_map.items():
+            node = root
+            for bit in code[:-1]:
+                child = node.left if bit == '0' else node.right
+                if child is None:
+                    child = HuffmanNode(None, 0)
+                    if bit == '0':
+                        node.left = child
+                    else:
+                        node.right = child
+                node = child
+
+            leaf = HuffmanNode(symbol, self.frequency_map.get(symbol, 0))
+            if code[-1] == '0':
+                node.left = leaf
+            else:
+                node.right = leaf
+
+        return root
+
+    def _flatten_tree(self) -> None:
+        if self.root is None:
+            self._tree_left = np.zeros(0, dtype=np.int32)
+            self._tree_right = np.zeros(0, dtype=np.int32)
+            return
+
+        internal_nodes = [self.root]
+        left: List[int] = []
+        right: List[int] = []
+        for node in internal_nodes:
+            for child, children in ((node.left, left), (node.right, right)):
+                if child is None:
+                    children.append(0)
+                elif child.symbol is not None:
+                    children.append(-(child.symbol + 1))
+                else:
+                    children.append(len(internal_nodes))
+                    internal_nodes.append(child)
+
+        self._tree_left = np.array(left, dtype=np.int32)
+        self._tree_right = np.array(right, dtype=np.int32)
         
     def compress_to_bit_string(self, data_bytes: bytes) -> Tuple[str, Dict[int, int]]:
-        return self.compress(data_bytes)
+        if not data_bytes:
+            return "", {}
+
+        self.data = data_bytes
+        if not self.code_map:
+            self.build()
+
+        # map() over the code table keeps the per-byte lookup inside C builtins.
+        return ''.join(map(self.code_map.__getitem__, self.data)), self.frequency_map
 
     def decompress_from_bit_string(self, bit_string: str, freq_map: Dict[int, int]) -> bytes:
         return self.decompress(bit_string, freq_map)
\ No newline at end of file
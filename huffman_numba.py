@@ -0,0 +1,47 @@
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, nogil=True, boundscheck=False)
+    def encode_bits(data: np.ndarray, code_val: np.ndarray, code_len: np.ndarray, out: np.ndarray) -> int:
+        # Codes are shifted into a bit accumulator that is flushed a byte at a time,
+        # so it never holds more than 7 + max(code_len) bits.
+        accumulator = 0
+        pending = 0
+        pos = 0
+        for i in range(data.shape[0]):
+            symbol = data[i]
+            accumulator = (accumulator << code_len[symbol]) | code_val[symbol]
+            pending += code_len[symbol]
+            while pending >= 8:
+                pending -= 8
+                out[pos] = (accumulator >> pending) & 0xFF
+                pos += 1
+            accumulator &= (1 << pending) - 1
+        if pending:
+            out[pos] = (accumulator << (8 - pending)) & 0xFF
+        return pos * 8 + pending
+
+    # Children >= 0 index internal nodes, negative children are leaves holding symbol -(child + 1)
+    # and 0 marks a missing child, since the root is never anyone's child.
+    @njit(cache=True, nogil=True, boundscheck=False)
+    def decode_bits(bits: np.ndarray, nbits: int, tree_left: np.ndarray, tree_right: np.ndarray, out: np.ndarray) -> int:
+        node = 0
+        count = 0
+        for i in range(nbits):
+            if (bits[i >> 3] >> (7 - (i & 7))) & 1:
+                node = tree_right[node]
+            else:
+                node = tree_left[node]
+            if node == 0:
+                return -1
+            if node < 0:
+                out[count] = -(node + 1)
+                count += 1
+                node = 0
+        return count
@@ -1,7 +1,19 @@
+import functools
 import numpy as np
 from typing import Dict, Any, Optional, Tuple, List
+from utils import BitVec
+from linear_numba import NUMBA_AVAILABLE
+
+if NUMBA_AVAILABLE:
+    from linear_numba import decode_blocks
 
 class LinearCodec:
+    PARAMETERS_VERSION = 1
+    # Codecs built from request parameters are capped: the syndrome table has 2 ** parity_bits
+    # entries and the cached matrices grow with the codeword length.
+    MAX_PARITY_BITS = 16
+    MAX_CODEWORD_BITS = 1024
+
     def __init__(self, n: int = 128, k: int = 120):
         if k >= n:
             raise ValueError("Message length k must be less than codeword length n")
@@ -10,28 +22,61 @@ class LinearCodec:
         self.k = k
         self.parity_bits = n - k
         
-        self.G_matrix: Optional[np.ndarray] = None
         self.H_matrix: Optional[np.ndarray] = None
-        self._syndrome_table: Dict[Tuple[int, ...], int] = {}
+        self.P_packed: Optional[np.ndarray] = None
+        self._H_packed: Optional[np.ndarray] = None
+        self._syndrome_lut: np.ndarray = np.zeros(0, dtype=np.intp)
+        self._parity_byte_lut: Optional[np.ndarray] = None
+        self._custom_H_matrix = False
+        # Whether decode_bitvec may work on packed bytes: needs byte-aligned blocks and the
+        # generated H, since _parity_byte_lut is derived from it.
+        self._packed_decode_ok = False
         
         self._initialize_matrices()
         
     def _initialize_matrices(self) -> None:
-        p = self.parity_bits
-        k = self.k
-        
+        (self.H_matrix, self.P_packed, self._H_packed,
+         self._syndrome_lut, self._parity_byte_lut) = self._build_codec(self.n, self.k)
+        self._custom_H_matrix = False
+        self._packed_decode_ok = not (self.k % 8 or self.n % 8)
+
+    # Bounded because (n, k) can come from request parameters.
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _build_codec(n: int, k: int) -> Tuple[np.ndarray, ...]:
+        p = n - k
         I_p = np.identity(p, dtype=np.uint8)
         
-        P_cols = self._generate_P_matrix_columns(I_p)
+        P_cols = LinearCodec._generate_P_matrix_columns(p, k)
         P_matrix = np.array(P_cols).T
         
-        self.H_matrix = np.hstack((P_matrix, I_p))
-        self.G_matrix = np.hstack((np.identity(k, dtype=np.uint8), P_matrix.T))
-        
-        self._build_syndrome_table()
+        H_matrix = np.hstack((P_matrix, I_p))
+        P_packed = np.packbits(P_matrix.T, axis=1)
+        H_packed, syndrome_lut = LinearCodec._build_syndrome_lut(H_matrix)
+
+        # Entry [j, v] is the packed parity contributed by message byte j having value v.
+        byte_bits = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1)
+        parity_byte_lut = np.stack([
+            np.bitwise_xor.reduce(byte_bits[:, :, None] * P_packed[None, j * 8:(j + 1) * 8, :], axis=1)
+            for j in range(k // 8)
+        ]).astype(np.uint8) if k % 8 == 0 else np.zeros((0, 256, P_packed.shape[1]), dtype=np.uint8)
+
+        # Shared by every codec with the same (n, k), so they must never be modified in place.
+        matrices = (H_matrix, P_packed, H_packed, syndrome_lut, parity_byte_lut)
+        for matrix in matrices:
+            matrix.setflags(write=False)
+        return matrices
         
-    def _generate_P_matrix_columns(self, I_p: np.ndarray) -> List[np.ndarray]:
-        p = self.parity_bits
+    # Encoding and decoding only use the packed tables, so the k x n generator matrix is not
+    # part of the shared cache and is built on first access.
+    @functools.cached_property
+    def G_matrix(self) -> Optional[np.ndarray]:
+        P_transposed = np.unpackbits(self.P_packed, axis=1, count=self.parity_bits)
+        return np.hstack((np.identity(self.k, dtype=np.uint8), P_transposed))
+
+    @staticmethod
+    def _generate_P_matrix_columns(p: int, k: int) -> List[np.ndarray]:
+        I_p = np.identity(p, dtype=np.uint8)
         id_cols = {tuple(I_p[:, i]) for i in range(p)}
         P_cols = []
         
@@ -39,24 +84,42 @@ class LinearCodec:
             col = np.array([int(bit) for bit in format(i, f'0{p}b')], dtype=np.uint8)
             if tuple(col) not in id_cols:
                 P_cols.append(col)
-                if len(P_cols) == self.k:
+                if len(P_cols) == k:
                     break
                     
         return P_cols
 
     def _build_syndrome_table(self) -> None:
-        self._syndrome_table.clear()
-        
         if self.H_matrix is None:
             return
-            
-        for pos in range(self.n):
-            error = np.zeros(self.n, dtype=np.uint8)
-            error[pos] = 1
-            syndrome = tuple((self.H_matrix @ error) % 2)
-            
-            if any(syndrome) and syndrome not in self._syndrome_table:
-                self._syndrome_table[syndrome] = pos
+        self._H_packed, self._syndrome_lut = self._build_syndrome_lut(self.H_matrix)
+
+    @staticmethod
+    def _build_syndrome_lut(H_matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Row j is the packed syndrome contributed by bit j of a received word.
+        H_packed = np.packbits(H_matrix.T, axis=1)
+        syndrome_bits = H_matrix.shape[0]
+        single_error_syndromes = LinearCodec._syndrome_index(H_packed, syndrome_bits)
+
+        # Entry s is the bit position to flip for syndrome s, or -1 for no correction.
+        syndrome_lut = np.full(1 << syndrome_bits, -1, dtype=np.intp)
+        for pos in range(H_matrix.shape[1] - 1, -1, -1):
+            syndrome = single_error_syndromes[pos]
+            if syndrome:
+                syndrome_lut[syndrome] = pos
+        return H_packed, syndrome_lut
+
+    @staticmethod
+    def _syndrome_index(packed: np.ndarray, syndrome_bits: int) -> np.ndarray:
+        # packbits zero fills the last byte, so those trailing bits are shifted back out.
+        index = np.zeros(packed.shape[0], dtype=np.intp)
+        for column in packed.T:
+            index = (index << 8) | column
+        return index >> (8 * packed.shape[1] - syndrome_bits)
+
+    def _syndromes(self, received_bits: np.ndarray) -> np.ndarray:
+        packed = np.bitwise_xor.reduce(received_bits[:, :, None] * self._H_packed[None, :, :], axis=1)
+        return self._syndrome_index(packed.astype(np.uint8), self.H_matrix.shape[0])
 
     def encode(self, message: str) -> str:
         if not self.G_matrix is not None:
@@ -64,9 +127,42 @@ class LinearCodec:
         if len(message) != self.k:
             raise ValueError(f"Message must be {self.k} bits, got {len(message)}")
             
-        message_vector = np.array([int(bit) for bit in message], dtype=np.uint8)
-        codeword = (message_vector @ self.G_matrix) % 2
-        return ''.join(map(str, codeword))
+        message_vector = np.frombuffer(message.encode('ascii'), dtype=np.uint8) - ord('0')
+        codeword = self.encode_bits(message_vector.reshape(1, self.k))[0]
+        return (codeword + ord('0')).tobytes().decode('ascii')
+
+    def encode_bits(self, bits: np.ndarray) -> np.ndarray:
+        if self.P_packed is None:
+            raise RuntimeError("Generator matrix not initialized")
+        if bits.ndim != 2 or bits.shape[1] != self.k:
+            raise ValueError(f"Message blocks must have shape (num_blocks, {self.k}), got {bits.shape}")
+
+        parity_packed = np.bitwise_xor.reduce(bits[:, :, None] * self.P_packed[None, :, :], axis=1).astype(np.uint8)
+        parity = np.unpackbits(parity_packed, axis=1, count=self.parity_bits)
+        return np.hstack((bits.astype(np.uint8), parity))
+
+    def encode_many(self, bits: np.ndarray) -> np.ndarray:
+        if bits.size % self.k != 0:
+            raise ValueError(f"Message length must be a multiple of {self.k} bits, got {bits.size}")
+        return self.encode_bits(bits.reshape(-1, self.k)).ravel()
+
+    def encode_bitvec(self, message: BitVec) -> BitVec:
+        if self.k % 8 or self.n % 8:
+            return BitVec.from_bits(self.encode_many(message.unpack()))
+        if message.nbits % self.k != 0:
+            raise ValueError(f"Message length must be a multiple of {self.k} bits, got {message.nbits}")
+
+        # Byte-aligned blocks are encoded without unpacking: message bytes are copied into
+        # the codeword buffer and parity bytes are XORed together from the per-byte table.
+        k_bytes = self.k // 8
+        blocks = message.buf[:message.nbits // 8].reshape(-1, k_bytes)
+        codewords = np.empty((len(blocks), self.n // 8), dtype=np.uint8)
+        codewords[:, :k_bytes] = blocks
+        parity = codewords[:, k_bytes:]
+        parity[:] = 0
+        for j in range(k_bytes):
+            parity ^= self._parity_byte_lut[j][blocks[:, j]]
+        return BitVec(codewords.ravel(), len(blocks) * self.n)
 
     def decode(self, received: str) -> Tuple[str, int]:
         if self.H_matrix is None:
@@ -74,33 +170,101 @@ class LinearCodec:
         if len(received) != self.n:
             raise ValueError(f"Received word must be {self.n} bits, got {len(received)}")
             
-        received_vector = np.array([int(bit) for bit in received], dtype=np.uint8)
-        syndrome = tuple((received_vector @ self.H_matrix.T) % 2)
-        
-        errors_corrected = 0
-        corrected_vector = received_vector.copy()
-        
-        if any(syndrome) and syndrome in self._syndrome_table:
-            error_pos = self._syndrome_table[syndrome]
-            corrected_vector[error_pos] ^= 1
-            errors_corrected = 1
-            
-        message = corrected_vector[:self.k]
-        return ''.join(map(str, message)), errors_corrected
+        received_vector = np.frombuffer(received.encode('ascii'), dtype=np.uint8) - ord('0')
+        messages, errors_corrected = self.decode_bits(received_vector.reshape(1, self.n))
+        return (messages[0] + ord('0')).tobytes().decode('ascii'), errors_corrected
+
+    def decode_bits(self, received_bits: np.ndarray) -> Tuple[np.ndarray, int]:
+        if self._H_packed is None:
+            raise RuntimeError("Parity check matrix not initialized")
+        if received_bits.ndim != 2 or received_bits.shape[1] != self.n:
+            raise ValueError(f"Received blocks must have shape (num_blocks, {self.n}), got {received_bits.shape}")
+
+        # Most blocks arrive intact, so only blocks with a nonzero syndrome are looked up and corrected.
+        syndromes = self._syndromes(received_bits)
+        errored_blocks = np.flatnonzero(syndromes)
+        error_positions = self._syndrome_lut[syndromes[errored_blocks]]
+        correctable = error_positions >= 0
+        blocks_to_correct = errored_blocks[correctable]
+
+        corrected_bits = received_bits.astype(np.uint8)
+        corrected_bits[blocks_to_correct, error_positions[correctable]] ^= 1
+        return corrected_bits[:, :self.k], len(blocks_to_correct)
+
+    def decode_bitvec(self, received: BitVec) -> Tuple[BitVec, int]:
+        num_blocks = received.nbits // self.n
+        if self._packed_decode_ok:
+            codewords = received.buf[:num_blocks * self.n // 8].reshape(num_blocks, self.n // 8)
+            messages = np.empty((num_blocks, self.k // 8), dtype=np.uint8)
+            if NUMBA_AVAILABLE:
+                errors_corrected = decode_blocks(codewords, self._parity_byte_lut, self._syndrome_lut, messages)
+            else:
+                errors_corrected = self._decode_packed(codewords, messages)
+            return BitVec(messages.ravel(), num_blocks * self.k), errors_corrected
+
+        received_bits = received.unpack()[:num_blocks * self.n].reshape(num_blocks, self.n)
+        messages, errors_corrected = self.decode_bits(received_bits)
+        return BitVec.from_bits(messages), errors_corrected
+
+    def _decode_packed(self, codewords: np.ndarray, messages: np.ndarray) -> int:
+        # Byte-aligned counterpart of decode_bits: the syndrome is the parity recomputed from the
+        # message bytes XOR the received parity, and corrections are applied to the packed bytes.
+        k_bytes = self.k // 8
+        messages[:] = codewords[:, :k_bytes]
+        syndromes_packed = codewords[:, k_bytes:].copy()
+        for j in range(k_bytes):
+            syndromes_packed ^= self._parity_byte_lut[j][messages[:, j]]
+        syndromes = self._syndrome_index(syndromes_packed, self.parity_bits)
+
+        errored_blocks = np.flatnonzero(syndromes)
+        error_positions = self._syndrome_lut[syndromes[errored_blocks]]
+        correctable = error_positions >= 0
+        in_message = correctable & (error_positions < self.k)
+        message_positions = error_positions[in_message]
+        messages[errored_blocks[in_message], message_positions >> 3] ^= (0x80 >> (message_positions & 7)).astype(np.uint8)
+        return int(correctable.sum())
 
     def get_parameters(self) -> Dict[str, Any]:
-        if self.H_matrix is None:
-            self._initialize_matrices()
-        return {
+        params: Dict[str, Any] = {
             "n": self.n,
             "k": self.k,
-            "H_matrix_list": self.H_matrix.tolist()
+            "version": self.PARAMETERS_VERSION
         }
+        # A custom parity check matrix cannot be regenerated from (n, k), so it is sent along.
+        if self._custom_H_matrix:
+            params["H_matrix_list"] = self.H_matrix.tolist()
+        return params
 
     @classmethod
     def from_parameters(cls, params: Dict[str, Any]) -> 'LinearCodec':
-        codec = cls(params["n"], params["k"])
+        n, k = params["n"], params["k"]
+        if not isinstance(n, int) or not isinstance(k, int) or not 0 < k < n <= cls.MAX_CODEWORD_BITS:
+            raise ValueError(f"Unsupported code dimensions n={n}, k={k} (need 0 < k < n <= {cls.MAX_CODEWORD_BITS})")
+        parity_bits = len(params["H_matrix_list"]) if "H_matrix_list" in params else n - k
+        if parity_bits > cls.MAX_PARITY_BITS:
+            raise ValueError(f"Codes with more than {cls.MAX_PARITY_BITS} parity bits are not supported, got {parity_bits}")
+
+        if "H_matrix_list" not in params:
+            # The generated H needs k distinct columns of weight >= 2 out of the 2 ** p - 1 nonzero ones.
+            if k > 2 ** parity_bits - parity_bits - 1:
+                raise ValueError(f"k={k} is too large for {parity_bits} parity bits")
+            return cls._from_versioned_parameters(n, k, params.get("version"))
+
+        # Older clients send the parity check matrix explicitly.
+        codec = cls(n, k)
         codec.H_matrix = np.array(params["H_matrix_list"], dtype=np.uint8)
+        if codec.H_matrix.shape != (parity_bits, n):
+            raise ValueError(f"H_matrix_list must have shape ({parity_bits}, {n}), got {codec.H_matrix.shape}")
         codec.G_matrix = None
+        codec._custom_H_matrix = True
+        codec._packed_decode_ok = False
         codec._build_syndrome_table()
-        return codec
\ No newline at end of file
+        return codec
+
+    # Decoding never mutates a codec, so one instance per parameter set is shared between requests.
+    @classmethod
+    @functools.lru_cache(maxsize=32)
+    def _from_versioned_parameters(cls, n: int, k: int, version: Any) -> 'LinearCodec':
+        if version != cls.PARAMETERS_VERSION:
+            raise ValueError(f"Unsupported linear codec parameters version: {version}")
+        return cls(n, k)
\ No newline at end of file
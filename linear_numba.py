@@ -0,0 +1,34 @@
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    # Blocks are byte-aligned packed codewords: k_bytes of message followed by the parity bytes.
+    # Each block's syndrome is the parity recomputed from its message bytes XOR the received parity.
+    @njit(cache=True, nogil=True, boundscheck=False)
+    def decode_blocks(codewords: np.ndarray, parity_byte_lut: np.ndarray, syndrome_lut: np.ndarray,
+                      out: np.ndarray) -> int:
+        num_blocks = codewords.shape[0]
+        k_bytes = parity_byte_lut.shape[0]
+        p_bytes = parity_byte_lut.shape[2]
+        corrected = 0
+        for b in range(num_blocks):
+            syndrome = 0
+            for i in range(p_bytes):
+                parity = codewords[b, k_bytes + i]
+                for j in range(k_bytes):
+                    parity ^= parity_byte_lut[j, codewords[b, j], i]
+                syndrome = (syndrome << 8) | parity
+            for j in range(k_bytes):
+                out[b, j] = codewords[b, j]
+            if syndrome:
+                pos = syndrome_lut[syndrome]
+                if pos >= 0:
+                    corrected += 1
+                    if pos < k_bytes * 8:
+                        out[b, pos >> 3] ^= 0x80 >> (pos & 7)
+        return corrected
@@ -1,155 +1,292 @@
-from flask import Flask, request, jsonify
-from typing import Dict
+import logging
+import ssl
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+import orjson
+from flask import Flask, Response, request
+from typing import Any, Dict, Optional
 from utils import (
+    BitVec,
     calculate_sha256, calculate_entropy,
-    bytes_to_bit_string,
-    pkcs7_unpad_bit_string,
+    pkcs7_unpad_bitvec,
     from_base64,to_base64
 )
 from huffman import HuffmanCodec
 from linear import LinearCodec
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
 N_HAMMING_DEFAULT = 128
 K_HAMMING_DEFAULT = 120
 
+# Successful responses keyed by the SHA256 of the request body, so a client retrying the
+# same payload is answered without decoding it again. Kept small as each holds an image.
+RESPONSE_CACHE_SIZE = 8
+# The /stream endpoint reads the body in slices of this many bytes.
+STREAM_CHUNK_SIZE = 64 * 1024
+_response_cache: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def _get_cached_response(key: str) -> Optional[Dict[str, Any]]:
+    with _response_cache_lock:
+        response_payload = _response_cache.get(key)
+        if response_payload is not None:
+            _response_cache.move_to_end(key)
+        return response_payload
+
+def _cache_response(key: str, response_payload: Dict[str, Any]) -> None:
+    with _response_cache_lock:
+        _response_cache[key] = response_payload
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+class RequestError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+@dataclass
+class DecodingParameters:
+    huffman_required: bool
+    huffman_freq_map: Dict[int, int]
+    original_huffman_bit_length: int
+    padded_length: int
+    linear_decoder: LinearCodec
+
+def _json_response(payload: Dict[str, Any], status: int) -> Response:
+    return app.response_class(orjson.dumps(payload), status=status, mimetype='application/json')
+
+def _parse_parameters(parameters: Dict[str, Any], compression_algorithm: str) -> DecodingParameters:
+    if compression_algorithm not in ("huffman", "none"):
+        raise RequestError(f"Unsupported compression algorithm: {compression_algorithm}")
+    huffman_required = compression_algorithm == "huffman"
+
+    freq_map_str = parameters.get("huffman_freq_map")
+    
+    original_huffman_bit_length = parameters.get("original_huffman_bit_length")
+    
+    padded_length = parameters.get("padded_length")
+    linear_codec_params = parameters.get("linear_codec_params")
+
+    if not all([freq_map_str or not huffman_required,
+                original_huffman_bit_length is not None,
+                padded_length is not None,
+                linear_codec_params]):
+        missing_params = []
+        if not freq_map_str and huffman_required: missing_params.append("huffman_freq_map")
+        if original_huffman_bit_length is None: missing_params.append("original_huffman_bit_length")
+        if padded_length is None: missing_params.append(
+            "padded_length")
+        if not linear_codec_params: missing_params.append("linear_codec_params")
+        raise RequestError(f"Missing parameters: {', '.join(missing_params)}")
+
+    if not isinstance(freq_map_str or {}, dict):
+        raise RequestError("huffman_freq_map must be an object.")
+    try:
+        huffman_freq_map: Dict[int, int] = {int(k): v for k, v in (freq_map_str or {}).items()}
+    except ValueError:
+        raise RequestError("Invalid keys in huffman_freq_map.")
+    if not all(0 <= symbol <= 255 for symbol in huffman_freq_map):
+        raise RequestError("Keys in huffman_freq_map must be byte values 0-255.")
+    if not all(isinstance(count, int) and not isinstance(count, bool) and count >= 0
+               for count in huffman_freq_map.values()):
+        raise RequestError("Values in huffman_freq_map must be non-negative integers.")
+
+    try:
+        linear_decoder = LinearCodec.from_parameters(linear_codec_params)
+    except Exception as e:
+        logger.warning("Error reconstructing linear codec from parameters: %s", e)
+        raise RequestError(f"Invalid linear codec parameters: {e}")
+
+    return DecodingParameters(huffman_required, huffman_freq_map, original_huffman_bit_length, padded_length,
+                              linear_decoder)
+
+def _reconstruct_image(bits_after_linear_decode: BitVec, total_errors_corrected: int, decoding: DecodingParameters,
+                       original_image_sha256: str, errors_introduced_by_client: int) -> Dict[str, Any]:
+    # Check if length matches what client sent as padded_length
+    if len(bits_after_linear_decode) != decoding.padded_length:
+        logger.error("CRITICAL LENGTH MISMATCH: After linear decode length is %d, "
+                     "but client expected %d bits at this stage.", len(bits_after_linear_decode), decoding.padded_length)
+        raise RequestError("Length mismatch after linear decoding.", 500)
+
+    # Removing PKCS#7 padding from bit string
+    try:
+        huffman_bits_to_decompress = pkcs7_unpad_bitvec(
+            bits_after_linear_decode,
+            block_size_bits=decoding.linear_decoder.k,
+            original_significant_bit_length=decoding.original_huffman_bit_length
+        )
+    except ValueError as e:
+        logger.warning("Error during PKCS#7 unpadding of bit string: %s", e)
+        raise RequestError(f"PKCS#7 Unpadding failed: {e}. Data likely corrupted.")
+
+    # The length after unpadding should be the original huffman bit length
+    if len(huffman_bits_to_decompress) != decoding.original_huffman_bit_length:
+        logger.error("LENGTH MISMATCH AFTER UNPADDING: "
+                     "Unpadded length is %d, "
+                     "expected original Huffman bit length %d.", len(huffman_bits_to_decompress),
+                     decoding.original_huffman_bit_length)
+        raise RequestError("Length after PKCS#7 unpadding inconsistent with original Huffman length.", 500)
+
+    # Huffman decompress
+    if not decoding.huffman_required:
+        final_reconstructed_image_data = huffman_bits_to_decompress.to_bytes()
+    else:
+        try:
+            huffman_decoder = HuffmanCodec.decoder_for_frequency_map(decoding.huffman_freq_map)
+            final_reconstructed_image_data = huffman_decoder.decode(huffman_bits_to_decompress)
+        except Exception as e:
+            logger.warning("Error during Huffman decompression: %s", e)
+            raise RequestError(f"Huffman decompression failed: {e}", 500)
+
+    if final_reconstructed_image_data is None:
+        raise RequestError("Huffman decompression failed to produce data.", 500)
+
+    reconstructed_sha256 = calculate_sha256(final_reconstructed_image_data)
+    reconstructed_entropy = calculate_entropy(final_reconstructed_image_data)
+    sha256_match = (reconstructed_sha256 == original_image_sha256)
+    error_difference = errors_introduced_by_client - total_errors_corrected
+    
+    b64_final_reconstructed_image_data = to_base64(final_reconstructed_image_data)
+
+    return {
+        "status": "success",
+        "decoded_image": b64_final_reconstructed_image_data,
+        "server_calculated_sha256": reconstructed_sha256,
+        "sha256_match": sha256_match,
+        "errors_corrected": total_errors_corrected,
+        "errors_difference_from_client_injected": error_difference,
+        "final_entropy": reconstructed_entropy
+    }
+
 @app.route('/', methods=['POST'])
 def process_request():
-    print("\n--- Server: Received new request ---")
+    logger.debug("--- Server: Received new request ---")
     try:
+        request_key = calculate_sha256(request.get_data())
+        cached_response = _get_cached_response(request_key)
+        if cached_response is not None:
+            logger.debug("--- Server: Returning cached response for a repeated payload. ---")
+            return _json_response(cached_response, 200)
+
         data = request.get_json()
         if not data:
-            return jsonify({"status": "error", "message": "Invalid JSON payload."}), 400
+            return _json_response({"status": "error", "message": "Invalid JSON payload."}, 400)
 
         b64_encoded_message = data.get("encoded_message")
         parameters = data.get("parameters", {})
         errors_introduced_by_client = data.get("errors", 0)
         original_image_sha256 = data.get("SHA256")
+        compression_algorithm = data.get("compression_algorithm", "huffman")
 
-        if not all([b64_encoded_message, parameters, original_image_sha256 is not None]):
-            missing = [field for field in ["encoded_message", "parameters", "SHA256"] if not data.get(field)]
-            return jsonify({"status": "error", "message": f"Missing required fields: {', '.join(missing)}"}), 400
-
-        freq_map_str = parameters.get("huffman_freq_map")
-        
-        original_huffman_bit_length = parameters.get("original_huffman_bit_length")
-        
-        padded_length = parameters.get("padded_length")
-        linear_codec_params = parameters.get("linear_codec_params")
-
-        if not all([freq_map_str,
-                    original_huffman_bit_length is not None,
-                    padded_length is not None,
-                    linear_codec_params]):
-            missing_params = []
-            if not freq_map_str: missing_params.append("huffman_freq_map")
-            if original_huffman_bit_length is None: missing_params.append("original_huffman_bit_length")
-            if padded_length is None: missing_params.append(
-                "padded_length")
-            if not linear_codec_params: missing_params.append("linear_codec_params")
-            return jsonify({"status": "error", "message": f"Missing parameters: {', '.join(missing_params)}"}), 400
-
-        try:
-            huffman_freq_map: Dict[int, int] = {int(k): v for k, v in freq_map_str.items()}
-        except ValueError:
-            return jsonify({"status": "error", "message": "Invalid keys in huffman_freq_map."}), 400
+        missing = [field for field, present in (("encoded_message", bool(b64_encoded_message)),
+                                                ("parameters", bool(parameters)),
+                                                ("SHA256", original_image_sha256 is not None)) if not present]
+        if missing:
+            return _json_response({"status": "error", "message": f"Missing required fields: {', '.join(missing)}"}, 400)
+        decoding = _parse_parameters(parameters, compression_algorithm)
 
         # Base64 Decoding
         errored_bytes_from_client = from_base64(b64_encoded_message)
-        errored_bits = bytes_to_bit_string(errored_bytes_from_client)
-        print(f"Received {len(errored_bits)} errored bits.")
+        errored_bits = BitVec.from_bytes(errored_bytes_from_client)
+        logger.debug("Received %d errored bits.", len(errored_bits))
 
         # Linear Decoding
-        try:
-            linear_decoder = LinearCodec.from_parameters(linear_codec_params)
-            N_EFFECTIVE = linear_decoder.n
-            K_EFFECTIVE = linear_decoder.k
-        except Exception as e:
-            print(f"Error reconstructing linear codec from parameters: {e}")
-            return jsonify({"status": "error", "message": f"Invalid linear codec parameters: {e}"}), 400
-
-        decoded_k_bit_chunks = []
-        total_errors_corrected = 0
-
-        num_n_bit_blocks_received = len(errored_bits) // N_EFFECTIVE
-        processed_bit_len = num_n_bit_blocks_received * N_EFFECTIVE
-
+        N_EFFECTIVE = decoding.linear_decoder.n
         if len(errored_bits) % N_EFFECTIVE != 0:
-            print(
-                f"Warning: Length of received errored bits ({len(errored_bits)}) is not a multiple of N_EFFECTIVE ({N_EFFECTIVE}). Processing only full blocks.")
+            logger.warning("Length of received errored bits (%d) is not a multiple of N_EFFECTIVE (%d). "
+                           "Processing only full blocks.", len(errored_bits), N_EFFECTIVE)
 
-        for i in range(0, processed_bit_len, N_EFFECTIVE):
-            chunk_n_bits = errored_bits[i: i + N_EFFECTIVE]
-            message_chunk_k_bits, corrected_in_block = linear_decoder.decode(chunk_n_bits)
-            decoded_k_bit_chunks.append(message_chunk_k_bits)
-            total_errors_corrected += corrected_in_block
+        bits_after_linear_decode, total_errors_corrected = decoding.linear_decoder.decode_bitvec(errored_bits)
+        logger.debug("Linearly decoded to %d bits. Corrected %d errors.", len(bits_after_linear_decode), total_errors_corrected)
 
-        bits_after_linear_decode = "".join(decoded_k_bit_chunks)
-        print(f"Linearly decoded to {len(bits_after_linear_decode)} bits. Corrected {total_errors_corrected} errors.")
+        response_payload = _reconstruct_image(bits_after_linear_decode, total_errors_corrected, decoding,
+                                              original_image_sha256, errors_introduced_by_client)
+        _cache_response(request_key, response_payload)
+        logger.debug("--- Server: Processing finished successfully. ---")
+        return _json_response(response_payload, 200)
 
-        # Check if length matches what client sent as padded_length
-        if len(bits_after_linear_decode) != padded_length:
-            print(f"CRITICAL LENGTH MISMATCH: After linear decode length is {len(bits_after_linear_decode)}, "
-                  f"but client expected {padded_length} bits at this stage.")
-            return jsonify({"status": "error", "message": "Length mismatch after linear decoding."}), 500
+    except RequestError as e:
+        return _json_response({"status": "error", "message": str(e)}, e.status)
+    except Exception as e:
+        logger.exception("--- Server: UNEXPECTED ERROR: %s ---", e)
+        return _json_response({"status": "error", "message": f"An unexpected server error occurred: {e}"}, 500)
 
-        # Removing PKCS#7 padding from bit string
+# Same pipeline as process_request, but the body is the raw linearly encoded bytes
+# (application/octet-stream) and the JSON fields travel in X- headers. The body is
+# decoded block by block as it is read, so it is never held as a whole or as Base64.
+@app.route('/stream', methods=['POST'])
+def process_stream_request():
+    logger.debug("--- Server: Received new stream request ---")
+    try:
         try:
-            huffman_bits_to_decompress = pkcs7_unpad_bit_string(
-                bits_after_linear_decode,
-                target_unpad_block_size_bits=K_EFFECTIVE,
-                original_significant_bit_length=original_huffman_bit_length
-            )
-        except ValueError as e:
-            print(f"Error during PKCS#7 unpadding of bit string: {e}")
-            return jsonify({"status": "error", "message": f"PKCS#7 Unpadding failed: {e}. Data likely corrupted."}), 400
-
-        # The length after unpadding should be the original huffman bit length
-        if len(huffman_bits_to_decompress) != original_huffman_bit_length:
-            print(f"LENGTH MISMATCH AFTER UNPADDING: "
-                  f"Unpadded length is {len(huffman_bits_to_decompress)}, "
-                  f"expected original Huffman bit length {original_huffman_bit_length}.")
-            return jsonify({"status": "error",
-                            "message": "Length after PKCS#7 unpadding inconsistent with original Huffman length."}), 500
-
-        # Huffman decompress
-        huffman_decoder = HuffmanCodec()
+            parameters = orjson.loads(request.headers.get("X-Parameters", "{}"))
+        except orjson.JSONDecodeError:
+            return _json_response({"status": "error", "message": "Invalid X-Parameters header."}, 400)
         try:
-            final_reconstructed_image_data = huffman_decoder.decompress_from_bit_string(
-                huffman_bits_to_decompress,
-                huffman_freq_map
-            )
-        except Exception as e:
-            print(f"Error during Huffman decompression: {e}")
-            return jsonify({"status": "error", "message": f"Huffman decompression failed: {e}"}), 500
-
-        if final_reconstructed_image_data is None:
-            return jsonify({"status": "error", "message": "Huffman decompression failed to produce data."}), 500
-
-        reconstructed_sha256 = calculate_sha256(final_reconstructed_image_data)
-        reconstructed_entropy = calculate_entropy(final_reconstructed_image_data)
-        sha256_match = (reconstructed_sha256 == original_image_sha256)
-        error_difference = errors_introduced_by_client - total_errors_corrected
-        
-        b64_final_reconstructed_image_data = to_base64(final_reconstructed_image_data)
-
-        response_payload = {
-            "status": "success",
-            "decoded_image": b64_final_reconstructed_image_data,
-            "server_calculated_sha256": reconstructed_sha256,
-            "sha256_match": sha256_match,
-            "errors_corrected": total_errors_corrected,
-            "errors_difference_from_client_injected": error_difference,
-            "final_entropy": reconstructed_entropy
-        }
-        print("--- Server: Processing finished successfully. ---")
-        return jsonify(response_payload), 200
+            errors_introduced_by_client = int(request.headers.get("X-Errors", 0))
+        except ValueError:
+            return _json_response({"status": "error", "message": "Invalid X-Errors header."}, 400)
+        original_image_sha256 = request.headers.get("X-SHA256")
+        compression_algorithm = request.headers.get("X-Compression-Algorithm", "huffman")
+
+        missing = [header for header, present in (("X-Parameters", bool(parameters)),
+                                                  ("X-SHA256", original_image_sha256 is not None)) if not present]
+        if missing:
+            return _json_response({"status": "error", "message": f"Missing required headers: {', '.join(missing)}"}, 400)
+        decoding = _parse_parameters(parameters, compression_algorithm)
+
+        # Eight codewords span a whole number of bytes, as do their eight messages, so
+        # groups of n bytes can be decoded independently and their outputs concatenated.
+        linear_decoder = decoding.linear_decoder
+        group_bytes = linear_decoder.n
+        decoded_chunks = []
+        decoded_nbits = 0
+        received_nbits = 0
+        total_errors_corrected = 0
+        pending = b""
+        while True:
+            chunk = request.stream.read(STREAM_CHUNK_SIZE)
+            received_nbits += len(chunk) * 8
+            pending += chunk
+            aligned = len(pending) if not chunk else len(pending) - len(pending) % group_bytes
+            if aligned:
+                decoded, errors_corrected = linear_decoder.decode_bitvec(BitVec.from_bytes(pending[:aligned]))
+                decoded_chunks.append(decoded.buf)
+                decoded_nbits += decoded.nbits
+                total_errors_corrected += errors_corrected
+                pending = pending[aligned:]
+            if not chunk:
+                break
+        logger.debug("Received %d errored bits.", received_nbits)
+
+        if received_nbits % linear_decoder.n != 0:
+            logger.warning("Length of received errored bits (%d) is not a multiple of N_EFFECTIVE (%d). "
+                           "Processing only full blocks.", received_nbits, linear_decoder.n)
+
+        bits_after_linear_decode = BitVec(np.concatenate(decoded_chunks) if decoded_chunks else np.zeros(0, dtype=np.uint8),
+                                          decoded_nbits)
+        logger.debug("Linearly decoded to %d bits. Corrected %d errors.", decoded_nbits, total_errors_corrected)
+
+        response_payload = _reconstruct_image(bits_after_linear_decode, total_errors_corrected, decoding,
+                                              original_image_sha256, errors_introduced_by_client)
+        logger.debug("--- Server: Processing finished successfully. ---")
+        return _json_response(response_payload, 200)
 
+    except RequestError as e:
+        return _json_response({"status": "error", "message": str(e)}, e.status)
     except Exception as e:
-        print(f"--- Server: UNEXPECTED ERROR: {e} ---")
-        return jsonify({"status": "error", "message": f"An unexpected server error occurred: {e}"}), 500
+        logger.exception("--- Server: UNEXPECTED ERROR: %s ---", e)
+        return _json_response({"status": "error", "message": f"An unexpected server error occurred: {e}"}, 500)
 
 if __name__ == '__main__':
-    print("Starting server...")
-    app.run(port=5000, debug=True)
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # Per-request access lines from the development server only at warning level and above.
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    logger.info("Starting server...")
+    logger.info("SHA256 backend: %s", ssl.OPENSSL_VERSION)
+    app.run(port=5000, debug=False)
@@ -1,22 +1,75 @@
 import hashlib
-import math
-import collections
+import threading
 import magic
-import base64
-import random
-from typing import Optional
+import pybase64
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional, Union
+
+_rng = np.random.default_rng()
+
+@dataclass(eq=False)
+class BitVec:
+    buf: np.ndarray
+    nbits: int
+
+    @classmethod
+    def from_bytes(cls, data: bytes, nbits: Optional[int] = None) -> 'BitVec':
+        buf = np.frombuffer(data, dtype=np.uint8)
+        return cls(buf, len(buf) * 8 if nbits is None else nbits)
+
+    @classmethod
+    def from_bits(cls, bits: np.ndarray) -> 'BitVec':
+        return cls(np.packbits(bits), bits.size)
+
+    @classmethod
+    def from_bit_string(cls, bit_str: str) -> 'BitVec':
+        return cls.from_bits(np.frombuffer(bit_str.encode('ascii'), dtype=np.uint8) - ord('0'))
+
+    def __len__(self) -> int:
+        return self.nbits
+
+    # Compares the significant bits only; the dataclass __eq__ would compare buf elementwise.
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, BitVec):
+            return NotImplemented
+        return self.nbits == other.nbits and np.array_equal(self.unpack(), other.unpack())
+
+    def to_bytes(self) -> bytes:
+        return self.buf.tobytes()
+
+    def unpack(self) -> np.ndarray:
+        return np.unpackbits(self.buf, count=self.nbits)
+
+    def to_bit_string(self) -> str:
+        return (self.unpack() + ord('0')).tobytes().decode('ascii')
+
+# Image signatures live in the first few bytes, so only the file header is sniffed.
+MIME_SNIFF_BYTES = 4096
+
+try:
+    _MAGIC: Optional[magic.Magic] = magic.Magic(mime=True)
+except magic.MagicException as e:
+    print(f"Warning: Could not load the libmagic database. Error: {e}")
+    _MAGIC = None
+# A libmagic cookie is not safe to use from several threads at once.
+_MAGIC_LOCK = threading.Lock()
 
 def get_mime_type(file_path: str) -> Optional[str]:
+    if _MAGIC is None:
+        return None
     try:
-        mime = magic.Magic(mime=True)
-        return mime.from_file(file_path)
+        with open(file_path, 'rb') as f:
+            header = f.read(MIME_SNIFF_BYTES)
+        with _MAGIC_LOCK:
+            return _MAGIC.from_buffer(header)
     except magic.MagicException as e:
         print(f"Warning: MIME type detection failed for {file_path}. Error: {e}")
         return None
 
 def is_image_file(file_path: str) -> bool:
     mime_type = get_mime_type(file_path)
-    return mime_type.startswith('image/')
+    return mime_type is not None and mime_type.startswith('image/')
 
 def read_file_bytes(file_path: str) -> bytes:
     with open(file_path, 'rb') as f:
@@ -28,101 +81,115 @@ def calculate_sha256(data: bytes) -> str:
 def calculate_entropy(data: bytes) -> float:
     if not data:
         return 0.0
-    counts = collections.Counter(data)
-    total_bytes = len(data)
-    entropy = 0.0
-    for count in counts.values():
-        probability = count / total_bytes
-        if probability > 0:
-            entropy -= probability * math.log2(probability)
-
-    return entropy
+    return entropy_from_histogram(np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256))
 
-def inject_bit_errors(bit_str: str, error_percentage: float) -> tuple[str, int]:
+def entropy_from_histogram(histogram: np.ndarray) -> float:
+    total = histogram.sum()
+    if total == 0:
+        return 0.0
+    probabilities = histogram[histogram > 0] / total
+    return float(-(probabilities * np.log2(probabilities)).sum())
+
+def hash_and_entropy_bytes(data: bytes, chunk_size: int = 1 << 20) -> tuple[str, float]:
+    # Hashing and counting each slice while it is still in cache makes this a single pass over the data.
+    sha256 = hashlib.sha256()
+    histogram = np.zeros(256, dtype=np.int64)
+    data_view = np.frombuffer(data, dtype=np.uint8)
+    for start in range(0, len(data_view), chunk_size):
+        chunk = data_view[start:start + chunk_size]
+        sha256.update(chunk)
+        histogram += np.bincount(chunk, minlength=256)
+
+    return sha256.hexdigest(), entropy_from_histogram(histogram)
+
+def inject_bit_errors(bits: BitVec, error_percentage: float) -> tuple[BitVec, int]:
     if error_percentage == 0:
-        return bit_str, 0
+        return bits, 0
 
-    total_bits = len(bit_str)
+    total_bits = bits.nbits
     num_errors = int(total_bits * error_percentage / 100.0)
     if num_errors == 0 and error_percentage > 0 and total_bits > 0:
         num_errors = 1
     if num_errors > total_bits:
         num_errors = total_bits
 
-    bit_list = list(bit_str)
-    error_indices = random.sample(range(total_bits), num_errors)
-
-    for index in error_indices:
-        bit_list[index] = '1' if bit_list[index] == '0' else '0'
+    error_indices = _rng.choice(total_bits, num_errors, replace=False)
+    error_mask = np.zeros_like(bits.buf)
+    np.bitwise_or.at(error_mask, error_indices >> 3, (0x80 >> (error_indices & 7)).astype(np.uint8))
 
-    return "".join(bit_list), num_errors
+    return BitVec(bits.buf ^ error_mask, total_bits), num_errors
 
 def to_base64(data_bytes: bytes) -> str:
-    return base64.b64encode(data_bytes).decode('utf-8')
+    return pybase64.b64encode_as_string(data_bytes)
 
 def from_base64(b64_string: str) -> bytes:
-    return base64.b64decode(b64_string.encode('utf-8'))
+    return pybase64.b64decode(b64_string, validate=False)
 
 def bytes_to_bit_string(byte_data: bytes) -> str:
-    return "".join(format(byte, '08b') for byte in byte_data)
+    return BitVec.from_bytes(byte_data).to_bit_string()
 
 def bit_string_to_bytes(bit_str: str) -> bytes:
-    if not bit_str:
-        return b''
-    padded_bit_str = bit_str + '0' * ((8 - len(bit_str) % 8) % 8)
-    byte_list = []
-    for i in range(0, len(padded_bit_str), 8):
-        byte_list.append(int(padded_bit_str[i:i + 8], 2))
+    # packbits zero-fills the last byte, matching the original right padding with '0's.
+    return BitVec.from_bit_string(bit_str).to_bytes()
 
-    return bytes(byte_list)
-
-def pkcs7_pad_bytes(data: bytes, block_size_bytes: int) -> bytes:
+def _pkcs7_padding_len(data_len: int, block_size_bytes: int) -> int:
     if block_size_bytes < 1 or block_size_bytes > 255:
         raise ValueError("Block size must be between 1 and 255 for PKCS#7 byte values.")
-    padding_len = block_size_bytes - (len(data) % block_size_bytes)
-    padding = bytes([padding_len] * padding_len)
-
-    return data + padding
+    return block_size_bytes - (data_len % block_size_bytes)
 
-def pkcs7_unpad_bytes(data: bytes, block_size_bytes: int) -> bytes:
-    if not data:
+def _pkcs7_unpadding_len(data: Union[bytes, np.ndarray], block_size_bytes: int) -> int:
+    if not len(data):
         raise ValueError("Cannot unpad empty data.")
-    padding_len = data[-1]
+    padding_len = int(data[-1])
     if padding_len == 0 or padding_len > block_size_bytes:
         raise ValueError(f"Invalid PKCS#7 padding value: {padding_len} (block size was {block_size_bytes})")
     if padding_len > len(data):
         raise ValueError(f"Invalid PKCS#7 padding: padding length {padding_len} > data length {len(data)}")
+    return padding_len
 
-    return data[:-padding_len]
+def pkcs7_pad_bytes(data: bytes, block_size_bytes: int) -> bytes:
+    padding_len = _pkcs7_padding_len(len(data), block_size_bytes)
+    padding = bytes([padding_len] * padding_len)
+
+    return data + padding
+
+def pkcs7_unpad_bytes(data: bytes, block_size_bytes: int) -> bytes:
+    return data[:-_pkcs7_unpadding_len(data, block_size_bytes)]
 
 def pkcs7_pad_bit_string(bit_str: str, block_size_bits: int) -> str:
+    return pkcs7_pad_bitvec(BitVec.from_bit_string(bit_str), block_size_bits).to_bit_string()
+
+def pkcs7_pad_bitvec(bits: BitVec, block_size_bits: int) -> BitVec:
     if block_size_bits <= 0 or block_size_bits % 8 != 0:
         raise ValueError("block_size_bits for PKCS#7 bit string padding must be a positive multiple of 8.")
 
-    current_bytes = bit_string_to_bytes(bit_str)
-    target_byte_block_size = block_size_bits // 8
+    data_len = len(bits.buf)
+    padding_len = _pkcs7_padding_len(data_len, block_size_bits // 8)
 
-    padded_bytes_for_k_multiple = pkcs7_pad_bytes(current_bytes, target_byte_block_size)
-    final_padded_bit_string = bytes_to_bit_string(padded_bytes_for_k_multiple)
-    return final_padded_bit_string
+    padded = np.empty(data_len + padding_len, dtype=np.uint8)
+    padded[:data_len] = bits.buf
+    padded[data_len:] = padding_len
+    return BitVec(padded, len(padded) * 8)
 
 def pkcs7_unpad_bit_string(padded_bit_str: str, target_unpad_block_size_bits: int, original_significant_bit_length: int = None) -> str:
-    if len(padded_bit_str) % 8 != 0:
-        raise ValueError(
-            f"Input bit string to pkcs7_unpad_bit_string (len {len(padded_bit_str)}) must have length multiple of 8.")
-    if target_unpad_block_size_bits <= 0 or target_unpad_block_size_bits % 8 != 0:
-        raise ValueError("target for unpadding must be a positive multiple of 8.")
+    unpadded_bits = pkcs7_unpad_bitvec(BitVec.from_bit_string(padded_bit_str), target_unpad_block_size_bits,
+                                       original_significant_bit_length)
+    return unpadded_bits.to_bit_string()
 
-    current_bytes = bit_string_to_bytes(padded_bit_str)
-    byte_block_to_unpad_against = target_unpad_block_size_bits // 8
+def pkcs7_unpad_bitvec(padded_bits: BitVec, block_size_bits: int, original_significant_bit_length: Optional[int] = None) -> BitVec:
+    if padded_bits.nbits % 8 != 0:
+        raise ValueError(f"Input bits to pkcs7_unpad_bitvec (len {padded_bits.nbits}) must have length multiple of 8.")
+    if block_size_bits <= 0 or block_size_bits % 8 != 0:
+        raise ValueError("target for unpadding must be a positive multiple of 8.")
 
-    unpadded_bytes = pkcs7_unpad_bytes(current_bytes, byte_block_to_unpad_against)
-    unpadded_bit_str_from_bytes = bytes_to_bit_string(unpadded_bytes)
+    # The result is a view of the buffer rather than a copy.
+    data = padded_bits.buf[:padded_bits.nbits // 8]
+    padding_len = _pkcs7_unpadding_len(data, block_size_bits // 8)
 
-    if original_significant_bit_length is not None:
-        if len(unpadded_bit_str_from_bytes) < original_significant_bit_length:
-            raise ValueError(
-                f"Unpadded bit string ({len(unpadded_bit_str_from_bytes)}) is shorter than expected original length ({original_significant_bit_length}). Padding value likely corrupted.")
-        return unpadded_bit_str_from_bytes[:original_significant_bit_length]
-    else:
-        return unpadded_bit_str_from_bytes
\ No newline at end of file
+    unpadded_nbits = (len(data) - padding_len) * 8
+    if original_significant_bit_length is None:
+        return BitVec(data[:-padding_len], unpadded_nbits)
+    if unpadded_nbits < original_significant_bit_length:
+        raise ValueError(
+            f"Unpadded bits ({unpadded_nbits}) are shorter than expected original length ({original_significant_bit_length}). Padding value likely corrupted.")
+    return BitVec(data[:(original_significant_bit_length + 7) // 8], original_significant_bit_length)